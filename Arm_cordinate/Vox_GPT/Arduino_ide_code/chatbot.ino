@@ -37,6 +37,32 @@ bool gripperState = false; // false = Open, true = Closed
 unsigned long lastMoveTime = 0;
 const int MOVE_DELAY = 20; // ms between each 1-degree step
 
+// --- Queued Sequence State ---
+// A SEQUENCE command queues several steps so the backend can send a whole cycle in one request.
+// Each step sets new targets, then waits dwellMs before the next step starts.
+#define MAX_SEQUENCE_STEPS 8
+#define NO_ANGLE -1
+
+// JSON memory for the largest command we accept: a SEQUENCE with MAX_SEQUENCE_STEPS steps, each holding
+// set_angles (4 joints), gripper and dwell_ms, plus room for the copied key/value strings.
+#define COMMAND_DOC_SIZE (JSON_OBJECT_SIZE(2) + JSON_ARRAY_SIZE(MAX_SEQUENCE_STEPS) + \
+                          MAX_SEQUENCE_STEPS * (JSON_OBJECT_SIZE(3) + JSON_OBJECT_SIZE(4)) + 256)
+
+struct SequenceStep {
+  int base;
+  int shoulder;
+  int elbow;
+  int wrist;
+  String gripper; // "open", "close" or empty for unchanged
+  unsigned long dwellMs;
+};
+
+SequenceStep sequenceSteps[MAX_SEQUENCE_STEPS];
+int sequenceLength = 0;
+int sequenceIndex = 0;
+bool sequenceActive = false;
+unsigned long sequenceStepStart = 0;
+
 ESP8266WebServer server(80);
 
 // Setup function
@@ -73,9 +99,45 @@ void setup() {
   server.begin();
 }
 
+// Set target angles for the gripper from an "open"/"close" string
+void setGripperTarget(const String& gripperCmd) {
+  if (gripperCmd == "close") {
+    targetGripperAngle = 0;
+    gripperState = true;
+  } else if (gripperCmd == "open") {
+    targetGripperAngle = 120;
+    gripperState = false;
+  }
+}
+
+// Apply the targets of the current sequence step
+void startSequenceStep() {
+  SequenceStep& step = sequenceSteps[sequenceIndex];
+  if (step.base != NO_ANGLE) targetBaseAngle = step.base;
+  if (step.shoulder != NO_ANGLE) targetShoulderAngle = step.shoulder;
+  if (step.elbow != NO_ANGLE) targetElbowAngle = step.elbow;
+  if (step.wrist != NO_ANGLE) targetWristAngle = step.wrist;
+  setGripperTarget(step.gripper);
+  sequenceStepStart = millis();
+}
+
+// Advance to the next sequence step once the current step's dwell time has elapsed
+void updateSequence() {
+  if (!sequenceActive) return;
+  if (millis() - sequenceStepStart < sequenceSteps[sequenceIndex].dwellMs) return;
+
+  sequenceIndex++;
+  if (sequenceIndex >= sequenceLength) {
+    sequenceActive = false;
+    return;
+  }
+  startSequenceStep();
+}
+
 // Main loop - handles web requests and non-blocking movement
 void loop() {
   server.handleClient();
+  updateSequence();
 
   // Non-blocking servo movement logic
   if (millis() - lastMoveTime > MOVE_DELAY) {
@@ -128,7 +190,8 @@ void handleCommand() {
     return;
   }
 
-  StaticJsonDocument<256> doc;
+  // Allocated on the heap: a full sequence is too large for the ESP8266's small stack
+  DynamicJsonDocument doc(COMMAND_DOC_SIZE);
   DeserializationError error = deserializeJson(doc, server.arg("plain"));
   if (error) {
     server.send(400, "application/json", "{\"status\":\"Invalid JSON\"}");
@@ -137,6 +200,9 @@ void handleCommand() {
 
   String command = doc["command"].as<String>();
 
+  // Any direct command takes over from a running sequence
+  sequenceActive = false;
+
   if (command == "SET_ANGLES") {
     // Update the target angles. The main loop() will handle the movement.
     if (doc.containsKey("base")) {
@@ -154,27 +220,13 @@ void handleCommand() {
     
     // Handle optional gripper command
     if (doc.containsKey("gripper")) {
-      String gripperCmd = doc["gripper"];
-      if (gripperCmd == "close") {
-        targetGripperAngle = 0;
-        gripperState = true;
-      } else if (gripperCmd == "open") {
-        targetGripperAngle = 120;
-        gripperState = false;
-      }
+      setGripperTarget(doc["gripper"].as<String>());
     }
     server.send(200, "application/json", "{\"status\":\"Movement initiated\"}");
   } else if (command == "GRIPPER_TOGGLE") {
     // This command is now primarily for toggling, but can also be used for explicit open/close
     if (doc.containsKey("gripper")) {
-      String gripperCmd = doc["gripper"];
-      if (gripperCmd == "close") {
-        targetGripperAngle = 0;
-        gripperState = true;
-      } else if (gripperCmd == "open") {
-        targetGripperAngle = 120;
-        gripperState = false;
-      }
+      setGripperTarget(doc["gripper"].as<String>());
     } else { // Toggle if no explicit state is given
       gripperState = !gripperState;
       targetGripperAngle = gripperState ? 120 : 0;
@@ -189,6 +241,31 @@ void handleCommand() {
     targetGripperAngle = 120; // Open gripper
     gripperState = false;
     server.send(200, "application/json", "{\"status\":\"Stop initiated\"}");
+  } else if (command == "SEQUENCE") {
+    // Queue the steps; each may carry "set_angles", "gripper" and "dwell_ms"
+    JsonArray steps = doc["steps"].as<JsonArray>();
+    if (steps.isNull() || steps.size() == 0 || steps.size() > MAX_SEQUENCE_STEPS) {
+      server.send(400, "application/json", "{\"status\":\"Invalid sequence\"}");
+      return;
+    }
+    sequenceLength = 0;
+    for (JsonObject stepDoc : steps) {
+      SequenceStep& step = sequenceSteps[sequenceLength++];
+      JsonObject angles = stepDoc["set_angles"];
+      step.base = angles.containsKey("base") ? constrain(angles["base"].as<int>(), 0, 180) : NO_ANGLE;
+      step.shoulder = angles.containsKey("shoulder") ? constrain(angles["shoulder"].as<int>(), 0, 170) : NO_ANGLE;
+      step.elbow = angles.containsKey("elbow") ? constrain(angles["elbow"].as<int>(), 0, 170) : NO_ANGLE;
+      step.wrist = angles.containsKey("wrist") ? constrain(angles["wrist"].as<int>(), 0, 180) : NO_ANGLE;
+      step.gripper = stepDoc["gripper"] | "";
+      step.dwellMs = stepDoc["dwell_ms"] | 0;
+    }
+    sequenceIndex = 0;
+    sequenceActive = true;
+    startSequenceStep();
+    server.send(200, "application/json", "{\"status\":\"Sequence started\"}");
+  } else if (command == "SEQUENCE_CANCEL") {
+    // The sequence was already cancelled above; the arm finishes moving to the current step's targets
+    server.send(200, "application/json", "{\"status\":\"Sequence cancelled\"}");
   } else {
     // Legacy incremental commands are no longer supported by this firmware
     // as they are inefficient. The backend should handle specific angle commands.
@@ -198,12 +275,13 @@ void handleCommand() {
 
 // Handle telemetry requests
 void handleTelemetry() {
-  StaticJsonDocument<200> doc;
+  StaticJsonDocument<256> doc;
   doc["baseAngle"] = baseServo.read();
   doc["shoulderAngle"] = shoulderServo.read();
   doc["elbowAngle"] = elbowServo.read();
   doc["wristAngle"] = wristServo.read();
   doc["gripperState"] = gripperState ? "Closed" : "Open";
+  doc["sequenceActive"] = sequenceActive;
   doc["systemStatus"] = (WiFi.status() == WL_CONNECTED) ? "Operational" : "Error";
   doc["boardType"] = "ESP8266";
 
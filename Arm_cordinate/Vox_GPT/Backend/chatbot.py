@@ -1,15 +1,18 @@
+import atexit
+import functools
+import io
 import threading
 import time
-import math
-from PIL import Image
-import numpy as np
-import cv2
+from math import acos, atan2, pi, sqrt
 from dotenv import load_dotenv
 import json
 import os
 import re
-import google.generativeai as genai
+import sys
+import orjson
+import pybase64
 import requests
+from requests.adapters import HTTPAdapter
 from flask_cors import CORS
 from flask import Flask, request, jsonify
 
@@ -24,18 +27,41 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in .env file")
 
-genai.configure(api_key=GEMINI_API_KEY)
-text_model = genai.GenerativeModel('gemini-pro')
-vision_model = genai.GenerativeModel('gemini-pro-vision')
+# The Gemini SDK is heavy to import, so the client is created on the first vision query
+_VISION_MODEL = None
+_VISION_MODEL_LOCK = threading.Lock()
+
+def _get_vision_model():
+    global _VISION_MODEL
+    with _VISION_MODEL_LOCK:
+        if _VISION_MODEL is None:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            _VISION_MODEL = genai.GenerativeModel('gemini-pro-vision')
+        return _VISION_MODEL
 
 # === ESP32 CONFIG ===
 ESP32_IP = "http://10.44.37.80"  # Change to your ESP32 IP
 
+# Reuse one keep-alive connection pool for all ESP32 traffic
+_ESP_SESSION = requests.Session()
+_ESP_SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+_ESP_SESSION.headers.update({"Connection": "keep-alive"})
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
 # === ROBOT ARM DIMENSIONS (in cm) ===
 BASE_HEIGHT = 7.0
 HUMERUS_LENGTH = 19.0  # Shoulder to Elbow
 ULNA_LENGTH = 15.0     # Elbow to Wrist
 
+# Derived constants used by the IK solver
+_H2 = HUMERUS_LENGTH ** 2
+_U2 = ULNA_LENGTH ** 2
+_HU2 = 2 * HUMERUS_LENGTH * ULNA_LENGTH
+_REACH_MAX = HUMERUS_LENGTH + ULNA_LENGTH
+_REACH_MIN = abs(HUMERUS_LENGTH - ULNA_LENGTH)
+_RAD2DEG = 180.0 / pi
+
 # === STATE VARIABLES ===
 JOINTS = {
     "base": {"pin": "D4", "min_angle": 0, "max_angle": 180, "current_angle": 90},
@@ -44,136 +70,274 @@ JOINTS = {
     "wrist": {"pin": "D8", "min_angle": 0, "max_angle": 180, "current_angle": 90},
     "gripper": {"pin": "D0", "open_angle": 120, "closed_angle": 0, "current_state": "open"}
 }
+# Joints driven by SET_ANGLES commands (the gripper is toggled separately)
+_CONTROLLABLE = ("base", "shoulder", "elbow", "wrist")
+# (min, max) servo limits, read once for the IK solver's clamps
+_BASE_LIMITS = (JOINTS["base"]["min_angle"], JOINTS["base"]["max_angle"])
+_SHOULDER_LIMITS = (JOINTS["shoulder"]["min_angle"], JOINTS["shoulder"]["max_angle"])
+_ELBOW_LIMITS = (JOINTS["elbow"]["min_angle"], JOINTS["elbow"]["max_angle"])
 HOME_POSITION_ANGLES = {"base": 10, "shoulder": 70, "elbow": 160, "wrist": 120}
 LAST_COMMAND_DETAILS = None
-IS_REPEATING = False
+# Guards LAST_COMMAND_DETAILS, _REPEAT_STOP and JOINTS[...]["current_angle"], which the repeat thread reads while /chat writes them.
+# LAST_COMMAND_DETAILS is replaced rather than mutated, so a reference taken under the lock stays consistent.
+_STATE_LOCK = threading.Lock()
+# Stop event of the active repeat run, or None. Each run gets its own event, so once a run is
+# stopped it can never resume; starting and stopping runs happens under _STATE_LOCK.
+_REPEAT_STOP = None
+# Dwell times for each repeat cycle, in milliseconds
+REPEAT_HOME_DWELL_MS = 3000
+REPEAT_TARGET_DWELL_MS = 1000
+REPEAT_PAUSE_MS = 1000
 
 # Global variables for saved poses
 saved_poses = {}
 next_pose_id = 1
 
 # === KINEMATICS ===
+def _clamp(value, limits):
+    lo, hi = limits
+    return lo if value < lo else hi if value > hi else value
+
 def calculate_inverse_kinematics(x, y, z):
     try:
-        base_angle_rad = math.atan2(y, x)
-        base_angle_deg = int(math.degrees(base_angle_rad))
+        base_angle_rad = atan2(y, x)
+        base_angle_deg = int(base_angle_rad * _RAD2DEG)
         servo_base_angle = 90 - base_angle_deg
-        servo_base_angle = max(JOINTS["base"]["min_angle"], min(JOINTS["base"]["max_angle"], servo_base_angle))
+        servo_base_angle = _clamp(servo_base_angle, _BASE_LIMITS)
 
-        r = math.sqrt(x**2 + y**2)
+        r = sqrt(x * x + y * y)
         z_prime = z - BASE_HEIGHT
-        d = math.sqrt(r**2 + z_prime**2)
+        d2 = r * r + z_prime * z_prime
+        d = sqrt(d2)
 
-        if d > (HUMERUS_LENGTH + ULNA_LENGTH) or d < abs(HUMERUS_LENGTH - ULNA_LENGTH):
+        if d > _REACH_MAX or d < _REACH_MIN:
             return {"error": "Target is unreachable."}
 
-        alpha1 = math.acos((HUMERUS_LENGTH**2 + d**2 - ULNA_LENGTH**2) / (2 * HUMERUS_LENGTH * d))
-        alpha2 = math.atan2(z_prime, r)
-        servo_shoulder_angle = int(math.degrees(alpha1 + alpha2))
-        servo_shoulder_angle = max(JOINTS["shoulder"]["min_angle"], min(JOINTS["shoulder"]["max_angle"], servo_shoulder_angle))
+        alpha1 = acos((_H2 + d2 - _U2) / (2 * HUMERUS_LENGTH * d))
+        alpha2 = atan2(z_prime, r)
+        servo_shoulder_angle = int((alpha1 + alpha2) * _RAD2DEG)
+        servo_shoulder_angle = _clamp(servo_shoulder_angle, _SHOULDER_LIMITS)
 
-        beta = math.acos((HUMERUS_LENGTH**2 + ULNA_LENGTH**2 - d**2) / (2 * HUMERUS_LENGTH * ULNA_LENGTH))
-        servo_elbow_angle = 180 - int(math.degrees(math.pi - beta))
-        servo_elbow_angle = max(JOINTS["elbow"]["min_angle"], min(JOINTS["elbow"]["max_angle"], servo_elbow_angle))
+        beta = acos((_H2 + _U2 - d2) / _HU2)
+        servo_elbow_angle = 180 - int((pi - beta) * _RAD2DEG)
+        servo_elbow_angle = _clamp(servo_elbow_angle, _ELBOW_LIMITS)
 
         return {"base": servo_base_angle, "shoulder": servo_shoulder_angle, "elbow": servo_elbow_angle}
     except (ValueError, ZeroDivisionError):
         return {"error": "Calculation error. The target might be out of the arm's work envelope."}
 
+def calculate_inverse_kinematics_batch(xyz):
+    """Vectorized IK for an (N, 3) array of x, y, z targets.
+
+    Returns an (N, 3) float array of (base, shoulder, elbow) servo angles with the
+    same truncation and clamping as calculate_inverse_kinematics. Rows for
+    unreachable targets are NaN.
+    """
+    import numpy as np
+    xyz = np.asarray(xyz, dtype=float).reshape(-1, 3)
+    x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+
+    servo_base_angle = 90 - np.trunc(np.degrees(np.arctan2(y, x)))
+    servo_base_angle = np.clip(servo_base_angle, *_BASE_LIMITS)
+
+    r = np.hypot(x, y)
+    z_prime = z - BASE_HEIGHT
+    d = np.hypot(r, z_prime)
+    d = np.where((d > _REACH_MAX) | (d < _REACH_MIN), np.nan, d)
+    d2 = d * d
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        alpha1 = np.arccos((_H2 + d2 - _U2) / (2 * HUMERUS_LENGTH * d))
+        alpha2 = np.arctan2(z_prime, r)
+        servo_shoulder_angle = np.trunc(np.degrees(alpha1 + alpha2))
+        servo_shoulder_angle = np.clip(servo_shoulder_angle, *_SHOULDER_LIMITS)
+
+        beta = np.arccos((_H2 + _U2 - d2) / _HU2)
+        servo_elbow_angle = 180 - np.trunc(np.degrees(np.pi - beta))
+        servo_elbow_angle = np.clip(servo_elbow_angle, *_ELBOW_LIMITS)
+
+    angles = np.column_stack((servo_base_angle, servo_shoulder_angle, servo_elbow_angle))
+    angles[np.isnan(angles).any(axis=1)] = np.nan
+    return angles
+
 # === BACKGROUND REPEAT THREAD ===
-def _repeat_movement_thread():
-    global IS_REPEATING, LAST_COMMAND_DETAILS, HOME_POSITION_ANGLES
+def _repeat_movement_thread(stop_event):
+    global LAST_COMMAND_DETAILS, HOME_POSITION_ANGLES
     print("Repeat thread started.")
-    while IS_REPEATING:
-        if not LAST_COMMAND_DETAILS or not IS_REPEATING: break
+    sequence_running = False
+    while not stop_event.is_set():
+        with _STATE_LOCK:
+            last_command = LAST_COMMAND_DETAILS
+            home_angles = dict(HOME_POSITION_ANGLES)
+        if not last_command:
+            stop_event.set()
+            break
         
         # Extract coordinates from LAST_COMMAND_DETAILS
-        coords = LAST_COMMAND_DETAILS['coords']
-
-        # --- Go to Home Position ---
-        home_angles_payload = {"command": "SET_ANGLES", **HOME_POSITION_ANGLES}
-        send_command_to_esp32(home_angles_payload)
-        time.sleep(3) # Wait for arm to reach home position (3 seconds)
-        if not IS_REPEATING: break
-
-        # --- Go to Last Coordinate ---
+        coords = last_command['coords']
         angles = calculate_inverse_kinematics(coords['x'], coords['y'], coords['z'])
-        if "error" not in angles:
-            send_command_to_esp32({"command": "SET_ANGLES", **angles})
-            time.sleep(1) # Wait for arm to reach target position (1 second)
-        else:
+        if "error" in angles:
             print(f"Error reaching last coordinate in repeat: {angles['error']}")
-            IS_REPEATING = False
-        
-        time.sleep(1) # Small delay before next cycle
+            stop_event.set()
+            break
+
+        # --- Home, then last coordinate, sent as one sequence so the cycle costs a single request ---
+        steps = [
+            {"set_angles": home_angles, "dwell_ms": REPEAT_HOME_DWELL_MS}, # Wait for arm to reach home position
+            {"set_angles": angles, "dwell_ms": REPEAT_TARGET_DWELL_MS},    # Wait for arm to reach target position
+        ]
+        send_command_to_esp32({"command": "SEQUENCE", "steps": steps})
+        sequence_running = True
+
+        # The ESP32 runs the steps itself; mirror each step in JOINTS once its dwell has passed,
+        # then pause briefly before the next cycle. A stop that arrived during the POST ends the wait at once.
+        if stop_event.wait(timeout=REPEAT_HOME_DWELL_MS / 1000): break
+        _set_current_angles(home_angles)
+        if stop_event.wait(timeout=REPEAT_TARGET_DWELL_MS / 1000): break
+        _set_current_angles(angles)
+        sequence_running = False
+        if stop_event.wait(timeout=REPEAT_PAUSE_MS / 1000): break
+
+    # Stopped mid-cycle: cancel from here, after our own SEQUENCE POST has returned, so the cancel
+    # always reaches the ESP32 last. Skip it if a newer repeat run has already taken over the arm.
+    if sequence_running:
+        with _STATE_LOCK:
+            superseded = _REPEAT_STOP is not None and _REPEAT_STOP is not stop_event
+        if not superseded:
+            send_command_to_esp32({"command": "SEQUENCE_CANCEL"}) # Don't let the queued cycle play out
+            _sync_joints_from_telemetry() # The arm may have stopped mid-cycle
     print("Repeat thread finished.")
 
 # === CAMERA HELPERS ===
-def capture_frame():
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened(): return None
-    ret, frame = cap.read(); cap.release()
-    return frame if ret else None
+# The camera is opened once and kept open; reopening it per request costs far more than a read.
+_CAM = None
+_CAM_LOCK = threading.Lock()
+
+def _release_camera():
+    global _CAM
+    with _CAM_LOCK:
+        if _CAM is not None:
+            _CAM.release()
+            _CAM = None
 
-def encode_frame_to_base64(frame):
-    _, buffer = cv2.imencode('.jpg', frame)
-    return base64.b64encode(buffer).decode('utf-8')
+atexit.register(_release_camera)
 
-def analyze_frame_with_gemini(frame, user_query):
+def capture_frame():
+    global _CAM
+    import cv2
+    with _CAM_LOCK:
+        if _CAM is None:
+            # V4L2 on Linux lets us shrink the driver's frame queue so read() returns the newest frame
+            cap = cv2.VideoCapture(0, cv2.CAP_V4L2) if sys.platform.startswith("linux") else None
+            if cap is None or not cap.isOpened():
+                # OpenCV builds without V4L2 (e.g. GStreamer-only) still work through the default backend
+                if cap is not None: cap.release()
+                cap = cv2.VideoCapture(0)
+            if not cap.isOpened():
+                cap.release()
+                return None
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            # MJPG frames are smaller on the wire and skip the driver-side YUYV->BGR conversion
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+            cap.read() # Drain one frame so auto-exposure can settle
+            _CAM = cap
+        ret, frame = _CAM.read()
+        if not ret:
+            # Drop the handle so the next request reopens the device
+            _CAM.release()
+            _CAM = None
+            return None
+        return frame
+
+def encode_frame_to_jpeg(frame):
+    import cv2
+    ok, buffer = cv2.imencode('.jpg', frame)
+    return buffer.tobytes() if ok else None
+
+def encode_jpeg_to_base64(jpeg_bytes):
+    return pybase64.b64encode_as_string(jpeg_bytes)
+
+def analyze_frame_with_gemini(jpeg_bytes, user_query):
     try:
-        image_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        response = vision_model.generate_content([f"Analyze this image: {user_query}", image_pil])
+        from PIL import Image
+        # PIL decodes the JPEG straight to RGB, so no BGR->RGB conversion of the raw frame is needed
+        image_pil = Image.open(io.BytesIO(jpeg_bytes))
+        response = _get_vision_model().generate_content([f"Analyze this image: {user_query}", image_pil])
         return response.text.strip()
     except Exception as e:
         return f"Vision analysis unavailable. Error: {str(e)[:100]}..."
 
 # === ROBOT ARM PARSERS ===
-def parse_move_to_command(user_input):
-    pattern = r"move\s+(?:arm\s+to\s+)?x\s*=\s*(-?\d+(?:\.\d+)?)\s*,\s*y\s*=\s*(-?\d+(?:\.\d+)?)\s*,\s*z\s*=\s*(-?\d+(?:\.\d+)?)\s*(?:(?:,|\s)\s*(?:g|gripper)\s+(open|close))?"
-    match = re.search(pattern, user_input, re.IGNORECASE)
-    if match:
-        coords = {"x": float(match.group(1)), "y": float(match.group(2)), "z": float(match.group(3))}
-        gripper_state = match.group(4)
-        return {"type": "move_to", "coords": coords, "gripper_state": gripper_state}
-    return None
-
-def parse_angle_command(user_input):
-    pattern = r"move\s+(base|shoulder|elbow|wrist)\s+to\s+(\d+)\s*degrees?"
-    match = re.search(pattern, user_input, re.IGNORECASE)
-    if match:
-        return {"joint": match.group(1).lower(), "value": int(match.group(2))}
-    return None
+# Every arm command pattern uses the same named groups, so a match from any of
+# the compiled regexes below can be decoded the same way via lastgroup.
+_MOVE_TO_PATTERN = r"(?P<move_to>move\s+(?:arm\s+to\s+)?x\s*=\s*(?P<x>-?\d+(?:\.\d+)?)\s*,\s*y\s*=\s*(?P<y>-?\d+(?:\.\d+)?)\s*,\s*z\s*=\s*(?P<z>-?\d+(?:\.\d+)?)\s*(?:(?:,|\s)\s*(?:g|gripper)\s+(?P<move_gripper>open|close))?)"
+_JOG_PATTERN = r"(?P<jog>(?:jog|move|nudge)\s+(?P<axis>x|y|z)\s+by\s+(?P<step>-?\d+(?:\.\d+)?))"
+_ANGLE_PATTERN = r"(?P<angle>move\s+(?P<joint>base|shoulder|elbow|wrist)\s+to\s+(?P<degrees>\d+)\s*degrees?)"
+_GRIPPER_PATTERN = r"(?P<gripper>(?P<gripper_state>open|close)\s+gripper)"
+
+# Full alternation, used when the first word doesn't tell us which command to expect
+_COMMAND_RE = re.compile("|".join((_MOVE_TO_PATTERN, _JOG_PATTERN, _ANGLE_PATTERN, _GRIPPER_PATTERN)))
+
+# Narrower regexes picked by the message's first word. Each holds every command that can start
+# with that word, in _COMMAND_RE's order, and is only tried at the start of the message, so a hit
+# there is exactly what _COMMAND_RE would have found. Anything else falls back to the full search.
+_JOG_RE = re.compile(_JOG_PATTERN)
+_GRIPPER_RE = re.compile(_GRIPPER_PATTERN)
+_PREFIX_DISPATCH = {
+    "move": re.compile("|".join((_MOVE_TO_PATTERN, _JOG_PATTERN, _ANGLE_PATTERN))),
+    "jog": _JOG_RE,
+    "nudge": _JOG_RE,
+    "open": _GRIPPER_RE,
+    "close": _GRIPPER_RE,
+}
 
-def parse_jog_command(user_input):
-    """Parses 'jog [axis] by [value]' commands."""
-    pattern = r"(?:jog|move|nudge)\s+(x|y|z)\s+by\s+(-?\d+(?:\.\d+)?)"
-    match = re.search(pattern, user_input, re.IGNORECASE)
-    if match:
-        axis = match.group(1).lower()
-        value = float(match.group(2))
-        return {"axis": axis, "value": value}
-    return None
-
-def parse_gripper_state_command(user_input):
-    """Parses 'open gripper' or 'close gripper' commands."""
-    pattern = r"(open|close)\s+gripper"
-    match = re.search(pattern, user_input, re.IGNORECASE)
-    if match:
-        return {"state": match.group(1).lower()}
-    return None
+@functools.lru_cache(maxsize=256)
+def _match_command(user_input):
+    """Finds the arm command in a message; cached because UIs often resend identical text."""
+    first_word = user_input.split(maxsplit=1)[0] if user_input else ""
+    prefix_re = _PREFIX_DISPATCH.get(first_word)
+    if prefix_re is not None:
+        match = prefix_re.match(user_input)
+        if match:
+            return match
+    return _COMMAND_RE.search(user_input)
+
+def parse_command(user_input):
+    """Parses move-to, jog, joint-angle and gripper commands in a single pass.
+
+    Patterns are case-sensitive, so callers pass the already-lowercased message.
+    A fresh dict is built on every call, since callers keep and modify the result.
+    """
+    match = _match_command(user_input)
+    if not match:
+        return None
+    kind = match.lastgroup
+    if kind == "move_to":
+        coords = {"x": float(match.group("x")), "y": float(match.group("y")), "z": float(match.group("z"))}
+        return {"type": "move_to", "coords": coords, "gripper_state": match.group("move_gripper")}
+    if kind == "jog":
+        return {"type": "jog", "axis": match.group("axis"), "value": float(match.group("step"))}
+    if kind == "angle":
+        return {"type": "angle", "joint": match.group("joint"), "value": int(match.group("degrees"))}
+    return {"type": "gripper", "state": match.group("gripper_state")}
 
 # === ESP32 COMMUNICATION ===
+def _set_current_angles(angles):
+    with _STATE_LOCK:
+        for joint_name in _CONTROLLABLE:
+            if joint_name in angles:
+                JOINTS[joint_name]["current_angle"] = angles[joint_name]
+
 def send_command_to_esp32(payload):
     global JOINTS
     try:
         url = f"{ESP32_IP}/api/arm/command"
-        response = requests.post(url, json=payload, timeout=15)
+        response = _ESP_SESSION.post(url, data=orjson.dumps(payload), headers=_JSON_HEADERS, timeout=15)
         if response.status_code == 200:
-            # Update local joint states if SET_ANGLES command was successful
+            # Update local joint states if SET_ANGLES command was successful.
+            # SEQUENCE steps are tracked by the repeat thread as each one comes due.
             if payload.get("command") == "SET_ANGLES":
-                for joint_name in ["base", "shoulder", "elbow", "wrist"]:
-                    if joint_name in payload:
-                        JOINTS[joint_name]["current_angle"] = payload[joint_name]
+                _set_current_angles(payload)
             return {"status": "success", "message": response.json().get("status", "Done")}
         return {"status": "error", "message": f"ESP32 returned status {response.status_code}"}
     except requests.RequestException as e:
@@ -194,17 +358,18 @@ def handle_help_request():
     ]
     return {"status": "success", "message": "You can try:\n" + "\n".join(f"• {ex}" for ex in examples)}
 
+_GREET_RE = re.compile(r"\b(?:hi|hello|hey|good\s+(?:morning|afternoon|evening))\b")
+
 def handle_greeting(user_input):
     """Handles simple greetings."""
-    greetings = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]
-    if any(greeting in user_input.lower() for greeting in greetings):
+    if _GREET_RE.search(user_input):
         return {"status": "success", "message": "Hello! How can I help you with the arm today?"}
     return None
 
 # === ROUTES ===
 @app.route('/chat', methods=['POST'])
 def chat():
-    global IS_REPEATING, LAST_COMMAND_DETAILS, saved_poses, next_pose_id, saved_poses, next_pose_id
+    global LAST_COMMAND_DETAILS, _REPEAT_STOP, saved_poses, next_pose_id, saved_poses, next_pose_id
     data = request.get_json()
     user_message = data.get('message', '').strip()
     if not user_message:
@@ -215,8 +380,13 @@ def chat():
 
     # --- Command Processing Order ---
     if 'stop' in user_lower or 'emergency' in user_lower:
-        if IS_REPEATING:
-            IS_REPEATING = False
+        with _STATE_LOCK:
+            repeat_stop, _REPEAT_STOP = _REPEAT_STOP, None
+            was_repeating = repeat_stop is not None and not repeat_stop.is_set()
+            if repeat_stop is not None:
+                repeat_stop.set()
+        if was_repeating:
+            # The repeat thread cancels its queued sequence and resyncs JOINTS on its way out
             result = {"status": "success", "message": "Repetition stopped."}
         else:
             result = send_command_to_esp32({"command": "EMERGENCY_STOP"})
@@ -224,18 +394,21 @@ def chat():
         payload = {"command": "SET_ANGLES", **HOME_POSITION_ANGLES, "gripper": "open"}
         result = send_command_to_esp32(payload)
     elif 'repeat' in user_lower:
-        if LAST_COMMAND_DETAILS is None:
-            result = {"status": "error", "message": "No last command to repeat."}
-        elif IS_REPEATING:
-            result = {"status": "info", "message": "Already in repeat mode."}
-        else:
-            IS_REPEATING = True
-            threading.Thread(target=_repeat_movement_thread, daemon=True).start()
-            result = {"status": "success", "message": "Starting repeat cycle. Say 'stop' to end."}
+        with _STATE_LOCK:
+            if LAST_COMMAND_DETAILS is None:
+                result = {"status": "error", "message": "No last command to repeat."}
+            elif _REPEAT_STOP is not None and not _REPEAT_STOP.is_set():
+                result = {"status": "info", "message": "Already in repeat mode."}
+            else:
+                _REPEAT_STOP = threading.Event()
+                threading.Thread(target=_repeat_movement_thread, args=(_REPEAT_STOP,), daemon=True).start()
+                result = {"status": "success", "message": "Starting repeat cycle. Say 'stop' to end."}
     elif user_lower == "save":
-        if LAST_COMMAND_DETAILS and LAST_COMMAND_DETAILS.get("type") == "move_to":
+        with _STATE_LOCK:
+            last_command = LAST_COMMAND_DETAILS
+        if last_command and last_command.get("type") == "move_to":
             pose_id = next_pose_id
-            saved_poses[pose_id] = LAST_COMMAND_DETAILS.copy()
+            saved_poses[pose_id] = last_command.copy()
             next_pose_id += 1
             result = {"status": "success", "message": f"Pose saved with ID: {pose_id}"}
         else:
@@ -253,7 +426,8 @@ def chat():
                 if "error" in angles:
                     result = {"status": "error", "message": angles["error"]}
                 else:
-                    LAST_COMMAND_DETAILS = saved_pose # Update LAST_COMMAND_DETAILS
+                    with _STATE_LOCK:
+                        LAST_COMMAND_DETAILS = saved_pose # Update LAST_COMMAND_DETAILS
                     payload = {"command": "SET_ANGLES", **angles}
                     result = send_command_to_esp32(payload) # Send angle command first
 
@@ -269,9 +443,12 @@ def chat():
         except (IndexError, ValueError):
             result = {"status": "error", "message": "Invalid 'move to id' command format. Please use: move to id X"}
     else:
-        move_to_cmd = parse_move_to_command(user_message)
-        angle_cmd = parse_angle_command(user_message)
-        jog_cmd = parse_jog_command(user_message)
+        command = parse_command(user_lower)
+        command_type = command["type"] if command else None
+        move_to_cmd = command if command_type == "move_to" else None
+        angle_cmd = command if command_type == "angle" else None
+        jog_cmd = command if command_type == "jog" else None
+        gripper_state_cmd = command if command_type == "gripper" else None
 
         if move_to_cmd:
             coords = move_to_cmd["coords"]
@@ -279,7 +456,8 @@ def chat():
             if "error" in angles:
                 result = {"status": "error", "message": angles["error"]}
             else:
-                LAST_COMMAND_DETAILS = move_to_cmd
+                with _STATE_LOCK:
+                    LAST_COMMAND_DETAILS = move_to_cmd
                 payload = {"command": "SET_ANGLES", **angles}
                 gripper_state_from_cmd = move_to_cmd.get("gripper_state")
                 gripper_state_to_send = None
@@ -294,19 +472,21 @@ def chat():
                     result = send_command_to_esp32(gripper_payload) # Then send gripper command
         
         elif jog_cmd:
-            if LAST_COMMAND_DETAILS is None:
+            with _STATE_LOCK:
+                last_command = LAST_COMMAND_DETAILS
+            if last_command is None:
                 result = {"status": "error", "message": "Cannot jog. Please move to an absolute position first."}
             else:
                 # Extract coords from LAST_COMMAND_DETAILS
-                current_coords = LAST_COMMAND_DETAILS['coords'].copy()
-                new_coords = current_coords.copy()
+                new_coords = last_command['coords'].copy()
                 new_coords[jog_cmd["axis"]] += jog_cmd["value"]
                 angles = calculate_inverse_kinematics(new_coords["x"], new_coords["y"], new_coords["z"])
                 if "error" in angles:
                     result = {"status": "error", "message": f"Jog move is unreachable: {angles['error']}"}
                 else:
-                    # Update LAST_COMMAND_DETAILS with new coordinates
-                    LAST_COMMAND_DETAILS['coords'] = new_coords
+                    # Update LAST_COMMAND_DETAILS with new coordinates (copied so saved poses are untouched)
+                    with _STATE_LOCK:
+                        LAST_COMMAND_DETAILS = {**last_command, "coords": new_coords}
                     payload = {"command": "SET_ANGLES", **angles}
                     result = send_command_to_esp32(payload)
 
@@ -314,11 +494,8 @@ def chat():
             joint, target_angle = angle_cmd["joint"], angle_cmd["value"]
             
             # Create a payload with current angles for all joints, then update the commanded joint
-            payload_angles = {}
-            for j_name, j_data in JOINTS.items():
-                if j_name in ["base", "shoulder", "elbow", "wrist"]:
-                    payload_angles[j_name] = j_data["current_angle"]
-            
+            with _STATE_LOCK:
+                payload_angles = {j_name: JOINTS[j_name]["current_angle"] for j_name in _CONTROLLABLE}
             payload_angles[joint] = target_angle # Override the commanded joint's angle
 
             min_a, max_a = JOINTS[joint]["min_angle"], JOINTS[joint]["max_angle"]
@@ -331,23 +508,23 @@ def chat():
         elif "frame" in user_lower and "see" in user_lower:
             frame = capture_frame()
             if frame is None: return jsonify({"response": "Camera not available."} ), 500
-            return jsonify({"response": analyze_frame_with_gemini(frame, user_message), "image": encode_frame_to_base64(frame)})
+            # Encode once; the JPEG feeds both the HTTP response and the vision model
+            jpeg_bytes = encode_frame_to_jpeg(frame)
+            if jpeg_bytes is None: return jsonify({"response": "Failed to encode camera frame."} ), 500
+            return jsonify({"response": analyze_frame_with_gemini(jpeg_bytes, user_message), "image": encode_jpeg_to_base64(jpeg_bytes)})
         
+        # --- Gripper commands ---
+        elif gripper_state_cmd:
+            result = send_command_to_esp32({"command": "GRIPPER_TOGGLE", "gripper": gripper_state_cmd["state"]})
+
+        elif 'gripper' in user_lower:
+            result = send_command_to_esp32({"command": "GRIPPER_TOGGLE"})
+
         elif 'help' in user_lower:
             result = handle_help_request()
         
-        elif handle_greeting(user_message):
-             result = handle_greeting(user_message)
-        
         else:
-            result = handle_help_request()
-
-    # --- Gripper commands ---
-    gripper_state_cmd = parse_gripper_state_command(user_message)
-    if gripper_state_cmd:
-        result = send_command_to_esp32({"command": "GRIPPER_TOGGLE", "gripper": gripper_state_cmd["state"]})
-    elif 'gripper' in user_lower:
-        result = send_command_to_esp32({"command": "GRIPPER_TOGGLE"})
+            result = handle_greeting(user_lower) or handle_help_request()
 
     if result and result.get("status") == "success" and not result.get("message"):
         result["message"] = "Done."
@@ -355,16 +532,60 @@ def chat():
     prefix = "✅ " if result.get("status") == "success" else "❌ " if result.get("status") == "error" else "ℹ️ "
     return jsonify({"response": prefix + result.get("message", "An unknown error occurred.")})
 
-@app.route('/telemetry', methods=['GET'])
-def telemetry():
+# Dashboards poll /telemetry at high rates; reuse a recent ESP32 reply instead of hitting the board each time.
+# Failed replies are cached too, so a slow or offline ESP32 isn't hammered either.
+TELEMETRY_CACHE_SECONDS = 0.1
+_TELEM_CACHE = None # {"t": monotonic time, "data": response body, "status": HTTP status}
+_TELEM_LOCK = threading.Lock()
+
+def _fetch_telemetry():
+    """Reads telemetry from the ESP32, returning (response body, HTTP status)."""
     try:
-        resp = requests.get(f"{ESP32_IP}/api/arm/telemetry", timeout=3)
+        resp = _ESP_SESSION.get(f"{ESP32_IP}/api/arm/telemetry", timeout=3)
         if resp.status_code == 200:
-            return jsonify(resp.json())
-        return jsonify({"error": "Failed to get telemetry"}), 500
+            return resp.json(), 200
+        return {"error": "Failed to get telemetry"}, 500
     except:
-        return jsonify({"error": "ESP32 unreachable"}), 500
+        return {"error": "ESP32 unreachable"}, 500
+
+def _sync_joints_from_telemetry():
+    """Refreshes JOINTS current angles from the angles the ESP32 reports."""
+    data, status = _fetch_telemetry()
+    if status != 200:
+        print(f"WARNING: Could not refresh joint angles from telemetry: {data.get('error')}")
+        return
+    _set_current_angles({j_name: data[f"{j_name}Angle"] for j_name in _CONTROLLABLE if f"{j_name}Angle" in data})
+
+def _telemetry_is_fresh(cached):
+    return cached is not None and time.monotonic() - cached["t"] < TELEMETRY_CACHE_SECONDS
+
+@app.route('/telemetry', methods=['GET'])
+def telemetry():
+    global _TELEM_CACHE
+    cached = _TELEM_CACHE
+    if _telemetry_is_fresh(cached):
+        return jsonify(cached["data"]), cached["status"]
+
+    # Only one poller fetches at a time. The others wait briefly, then serve the last reply
+    # rather than queueing up and tying down server threads needed by /chat.
+    if not _TELEM_LOCK.acquire(timeout=TELEMETRY_CACHE_SECONDS):
+        if cached is not None:
+            return jsonify(cached["data"]), cached["status"]
+        return jsonify({"error": "Telemetry busy"}), 503
+    try:
+        cached = _TELEM_CACHE
+        if not _telemetry_is_fresh(cached):
+            data, status = _fetch_telemetry()
+            cached = _TELEM_CACHE = {"t": time.monotonic(), "data": data, "status": status}
+    finally:
+        _TELEM_LOCK.release()
+    return jsonify(cached["data"]), cached["status"]
 
 if __name__ == '__main__':
     print("Starting Flask server with Jogging support...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    if os.getenv("FLASK_DEBUG", "0").lower() in ("1", "true", "yes"):
+        app.run(host='0.0.0.0', port=5000, debug=True)
+    else:
+        # Multi-threaded production server so /chat, /telemetry and the repeat thread don't block each other
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=5000, threads=4)
@@ -0,0 +1,45 @@
+import unittest
+
+import chatbot
+
+
+class FirstWordDispatchTest(unittest.TestCase):
+    """_match_command's first-word shortcut must find the same command as a full _COMMAND_RE search."""
+
+    def assert_same_as_full_search(self, message):
+        message = message.lower()
+        expected = chatbot._COMMAND_RE.search(message)
+        actual = chatbot._match_command(message)
+        if expected is None:
+            self.assertIsNone(actual, message)
+        else:
+            self.assertIsNotNone(actual, message)
+            # The narrowed regexes lack some groups, so compare only the ones that matched
+            def matched_groups(match):
+                return {name: value for name, value in match.groupdict().items() if value is not None}
+            self.assertEqual((actual.span(), actual.lastgroup, matched_groups(actual)),
+                             (expected.span(), expected.lastgroup, matched_groups(expected)), message)
+
+    def test_help_examples(self):
+        help_lines = chatbot.handle_help_request()["message"].splitlines()[1:]
+        for line in help_lines:
+            self.assert_same_as_full_search(line.lstrip("• "))
+
+    def test_mixed_commands(self):
+        for message in [
+            "move and close gripper",
+            "jog and open gripper",
+            "open the gripper, then close gripper",
+            "jog, move base to 90 degrees",
+            "nudge z by 2.5",
+            "move z by -3 then close gripper",
+            "Move Arm To X=10, Y=5, Z=20 Gripper Close",
+        ]:
+            self.assert_same_as_full_search(message)
+
+    def test_mixed_gripper_command_is_explicit(self):
+        self.assertEqual(chatbot.parse_command("move and close gripper"), {"type": "gripper", "state": "close"})
+
+
+if __name__ == "__main__":
+    unittest.main()
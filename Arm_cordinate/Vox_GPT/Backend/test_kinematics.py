@@ -0,0 +1,44 @@
+import math
+import random
+import unittest
+
+import chatbot
+
+
+class BatchInverseKinematicsTest(unittest.TestCase):
+    """calculate_inverse_kinematics_batch must agree with the scalar solver point for point."""
+
+    def assert_matches_scalar(self, points):
+        batch = chatbot.calculate_inverse_kinematics_batch(points)
+        self.assertEqual(batch.shape, (len(points), 3))
+        for (x, y, z), row in zip(points, batch):
+            scalar = chatbot.calculate_inverse_kinematics(x, y, z)
+            if "error" in scalar:
+                self.assertTrue(all(math.isnan(v) for v in row), f"expected NaN row for {(x, y, z)}, got {row}")
+            else:
+                expected = [scalar["base"], scalar["shoulder"], scalar["elbow"]]
+                self.assertEqual(row.tolist(), expected, f"mismatch at {(x, y, z)}")
+
+    def test_reachable_points(self):
+        rng = random.Random(0)
+        reach = chatbot.HUMERUS_LENGTH + chatbot.ULNA_LENGTH
+        points = []
+        while len(points) < 2000:
+            x, y, z = (rng.uniform(-reach, reach) for _ in range(3))
+            if "error" not in chatbot.calculate_inverse_kinematics(x, y, z):
+                points.append((x, y, z))
+        self.assert_matches_scalar(points)
+
+    def test_unreachable_points(self):
+        self.assert_matches_scalar([(100.0, 0.0, 0.0), (0.0, 0.0, 60.0), (1.0, 1.0, chatbot.BASE_HEIGHT)])
+
+    def test_target_at_shoulder(self):
+        # d == 0: the target sits exactly on the shoulder pivot
+        self.assert_matches_scalar([(0.0, 0.0, chatbot.BASE_HEIGHT)])
+
+    def test_mixed_batch(self):
+        self.assert_matches_scalar([(20.0, 0.0, 25.0), (100.0, 0.0, 0.0), (10.0, -10.0, 15.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()